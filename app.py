@@ -1,15 +1,83 @@
+import logging
 import os
 import re
+import shutil
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import wraps
+from cachetools import TTLCache
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session, abort
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session, abort, make_response, current_app
+from flask.sessions import SecureCookieSessionInterface
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from config import config
-import imghdr
+
+logger = logging.getLogger(__name__)
 
 # Initialize extensions
-db = SQLAlchemy()
+# Every write path commits explicitly, so skip autoflush and post-commit reloads
+db = SQLAlchemy(session_options={'autoflush': False, 'expire_on_commit': False})
+
+# Gmail address pattern, compiled once instead of on every request
+_GMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@gmail\.com$')
+
+# Leading bytes expected for each allowed certificate extension
+_FILE_SIGNATURES = {
+    'pdf': (b'%PDF',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+}
+
+# Linux can copy between regular files with sendfile(2), other platforms need a socket
+_SENDFILE_TO_FILE = sys.platform.startswith('linux')
+_COPY_BUFSIZE = 1024 * 1024
+
+# Concurrent file writes during bulk upload
+_UPLOAD_WORKERS = 8
+
+# Bulk-upload upsert, understood by both PostgreSQL and SQLite (3.24+)
+_UPSERT_CERTIFICATE_SQL = db.text("""
+    INSERT INTO certificates (email, certificate_filename, original_filename, upload_date)
+    VALUES (:email, :certificate_filename, :original_filename, :upload_date)
+    ON CONFLICT (email) DO UPDATE SET
+        certificate_filename = excluded.certificate_filename,
+        original_filename = excluded.original_filename,
+        upload_date = excluded.upload_date
+""").bindparams(db.bindparam('upload_date', type_=db.DateTime))
+
+# scrypt (N=2**15, r=8, p=1) verifies faster than Werkzeug's 600k-round PBKDF2 default
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+
+# Checked for unknown usernames so failed logins take as long as real ones
+_DUMMY_HASH = generate_password_hash('dummy-password', method=PASSWORD_HASH_METHOD)
+
+# Recent public lookups keyed by email. Entries are plain tuples rather than ORM
+# objects, and the short TTL bounds staleness in other gunicorn workers.
+CertificateRecord = namedtuple('CertificateRecord',
+                               'id email certificate_filename original_filename upload_date file_ext')
+_cert_cache = TTLCache(maxsize=1024, ttl=60)
+_cert_cache_lock = threading.Lock()
+
+# Public endpoints never write to the session themselves
+PUBLIC_ENDPOINTS = frozenset({'index', 'search_certificate', 'preview_certificate',
+                              'download_certificate', 'static'})
+
+class PublicSessionInterface(SecureCookieSessionInterface):
+    """Cookie session that skips re-signing the cookie on unchanged public requests"""
+    
+    def save_session(self, app, session, response):
+        if not session.modified and request.endpoint in PUBLIC_ENDPOINTS:
+            # Responses that read the session still vary by cookie
+            if session.accessed:
+                response.vary.add('Cookie')
+            return
+        super().save_session(app, session, response)
 
 # Define models here, before create_app
 class Certificate(db.Model):
@@ -19,12 +87,139 @@ class Certificate(db.Model):
     certificate_filename = db.Column(db.String(255), nullable=False)
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
     original_filename = db.Column(db.String(255))
+    
+    # Covering index so email lookups are answered without touching the table
+    __table_args__ = (
+        db.Index('ix_certificates_email_covering',
+                 'email', 'certificate_filename', 'original_filename', 'upload_date'),
+    )
 
 class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
+    
+    def needs_rehash(self):
+        """Check if the stored hash was made with an older hashing method"""
+        return not self.password_hash.startswith(f"{PASSWORD_HASH_METHOD}$")
+
+# Helper functions
+def allowed_extension(ext):
+    """Check if an already split, lowercased file extension is allowed"""
+    return ext in current_app.config['ALLOWED_EXTENSIONS']
+
+def validate_email(email):
+    """Validate Gmail format"""
+    return _GMAIL_RE.match(email) is not None
+
+def classify_upload(filename):
+    """Split a bulk-upload filename into its email and extension
+
+    The filename should be in format: email.extension
+    For example: waqas@gmail.com.png
+
+    Returns (email, ext, error); error is None when the filename is usable.
+    """
+    stem, dot, ext = filename.rpartition('.')
+    ext = ext.lower()
+    if not dot or not allowed_extension(ext):
+        return None, None, "Invalid file type. Allowed: PDF, PNG, JPG, JPEG"
+
+    email = stem.lower()
+    if not validate_email(email):
+        return None, None, "Invalid Gmail address. Must be like 'example@gmail.com'"
+
+    return email, ext, None
+
+def is_certificate_file(stream, ext):
+    """Check the uploaded stream's magic bytes match its extension before it touches disk"""
+    try:
+        stream.seek(0)
+        header = stream.read(8)
+        stream.seek(0)
+    except (OSError, ValueError):
+        return False
+    return header.startswith(_FILE_SIGNATURES.get(ext, ()))
+
+def save_upload(file, file_path):
+    """Write an uploaded file to disk without a Python-level copy loop where possible"""
+    src = file.stream
+    src.seek(0)
+    with open(file_path, 'wb') as dst:
+        # Werkzeug spools uploads under 500 KB in memory; fileno() would force them to disk
+        in_memory = isinstance(src, tempfile.SpooledTemporaryFile) and not src._rolled
+        try:
+            src_fd = src.fileno() if _SENDFILE_TO_FILE and not in_memory else None
+        except OSError:
+            # e.g. a BytesIO stream
+            src_fd = None
+
+        if src_fd is None:
+            shutil.copyfileobj(src, dst, _COPY_BUFSIZE)
+            return
+
+        offset, size = 0, os.fstat(src_fd).st_size
+        while offset < size:
+            sent = os.sendfile(dst.fileno(), src_fd, offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
+
+def upsert_certificates(rows):
+    """Insert certificate rows, updating those whose email already exists"""
+    # One executemany (paged on PostgreSQL via executemany_mode); no ORM objects are built per row
+    db.session.execute(_UPSERT_CERTIFICATE_SQL, rows)
+
+def get_certificate(email):
+    """Look up a certificate by email, served from the in-process cache when fresh"""
+    with _cert_cache_lock:
+        record = _cert_cache.get(email)
+    if record is not None:
+        return record
+
+    row = db.session.execute(
+        db.select(Certificate.id,
+                  Certificate.email,
+                  Certificate.certificate_filename,
+                  Certificate.original_filename,
+                  Certificate.upload_date)
+        .filter_by(email=email)
+    ).first()
+    if row is None:
+        return None
+
+    # Split the extension once here so preview and download don't re-parse it
+    record = CertificateRecord(*row, file_ext=row.certificate_filename.rpartition('.')[2].lower())
+    with _cert_cache_lock:
+        _cert_cache[email] = record
+    return record
+
+def forget_certificate(email):
+    """Drop a cached lookup after the certificate changes"""
+    with _cert_cache_lock:
+        _cert_cache.pop(email, None)
+
+def render_preview(certificate):
+    """Render the preview page for an already loaded certificate"""
+    # Determine file type
+    is_pdf = certificate.file_ext == 'pdf'
+    is_image = certificate.file_ext in ['png', 'jpg', 'jpeg']
+
+    return render_template('preview.html', 
+                         certificate=certificate,
+                         is_pdf=is_pdf,
+                         is_image=is_image)
+
+def admin_required(f):
+    """Decorator to require admin authentication"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('admin_logged_in'):
+            flash('Please login to access admin panel', 'error')
+            return redirect(url_for('admin_login'))
+        return f(*args, **kwargs)
+    return decorated_function
 
 def create_app(config_name='default'):
     """Application factory"""
@@ -36,21 +231,29 @@ def create_app(config_name='default'):
     
     # Initialize extensions with app
     db.init_app(app)
+    app.session_interface = PublicSessionInterface()
     
     # Create database tables
     with app.app_context():
         db.create_all()
         
+        # create_all skips existing tables, so add any indexes defined since
+        for index in Certificate.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        
         # Create admin user if it doesn't exist
-        admin_exists = User.query.filter_by(username=app.config['ADMIN_USERNAME']).first()
+        admin_exists = db.session.execute(
+            db.select(User).filter_by(username=app.config['ADMIN_USERNAME'])
+        ).scalar()
         if not admin_exists:
             admin_user = User(
                 username=app.config['ADMIN_USERNAME'],
-                password_hash=generate_password_hash(app.config['ADMIN_PASSWORD'])
+                password_hash=generate_password_hash(app.config['ADMIN_PASSWORD'],
+                                                     method=PASSWORD_HASH_METHOD)
             )
             db.session.add(admin_user)
             db.session.commit()
-            print(f"Admin user created: {app.config['ADMIN_USERNAME']}")
+            logger.info("Admin user created: %s", app.config['ADMIN_USERNAME'])
     
     # Register routes
     register_routes(app)
@@ -60,24 +263,6 @@ def create_app(config_name='default'):
 def register_routes(app):
     """Register all application routes"""
     
-    # Helper functions
-    def allowed_file(filename):
-        """Check if file extension is allowed"""
-        return '.' in filename and \
-               filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
-    
-    def validate_email(email):
-        """Validate Gmail format"""
-        pattern = r'^[a-zA-Z0-9._%+-]+@gmail\.com$'
-        return re.match(pattern, email) is not None
-    
-    def is_image_file(filepath):
-        """Check if file is a valid image"""
-        try:
-            return imghdr.what(filepath) in ['jpeg', 'png', 'gif']
-        except:
-            return False
-    
     # Public routes
     @app.route('/')
     def index():
@@ -99,10 +284,11 @@ def register_routes(app):
                 return render_template('search.html', email=email)
             
             # Search for certificate
-            certificate = Certificate.query.filter_by(email=email).first()
+            certificate = get_certificate(email)
             
             if certificate:
-                return redirect(url_for('preview_certificate', email=email))
+                # Render directly rather than redirecting to /preview and querying again
+                return render_preview(certificate)
             else:
                 flash('No certificate found for this email address', 'error')
                 return render_template('search.html', email=email)
@@ -112,26 +298,33 @@ def register_routes(app):
     @app.route('/preview/<email>')
     def preview_certificate(email):
         """Preview certificate"""
-        certificate = Certificate.query.filter_by(email=email).first()
+        certificate = get_certificate(email)
         
         if not certificate:
             flash('Certificate not found', 'error')
             return redirect(url_for('search_certificate'))
         
-        # Determine file type
-        file_ext = certificate.certificate_filename.rsplit('.', 1)[1].lower()
-        is_pdf = file_ext == 'pdf'
-        is_image = file_ext in ['png', 'jpg', 'jpeg']
+        # Flash messages are one-off content, so only unchanged plain pages are revalidated
+        conditional = certificate.upload_date is not None and '_flashes' not in session
+        response = make_response(render_preview(certificate))
+        # Revalidate on every view so replaced or deleted certificates show up at once,
+        # and keep the login-dependent page out of shared caches
+        response.cache_control.no_cache = True
+        response.cache_control.private = True
         
-        return render_template('preview.html', 
-                             certificate=certificate,
-                             is_pdf=is_pdf,
-                             is_image=is_image)
+        if conditional:
+            # The navbar differs for admins, so the login state is part of the ETag
+            response.last_modified = certificate.upload_date
+            response.set_etag(f"{certificate.id}-{certificate.upload_date.timestamp()}-"
+                              f"{int(bool(session.get('admin_logged_in')))}")
+            response = response.make_conditional(request)
+        
+        return response
     
     @app.route('/download/<email>')
     def download_certificate(email):
         """Download certificate"""
-        certificate = Certificate.query.filter_by(email=email).first()
+        certificate = get_certificate(email)
         
         if not certificate:
             flash('Certificate not found', 'error')
@@ -144,11 +337,21 @@ def register_routes(app):
             return redirect(url_for('search_certificate'))
         
         # Use original filename if available, otherwise generate one
-        download_name = certificate.original_filename or f"certificate_{email}.{certificate.certificate_filename.rsplit('.', 1)[1]}"
+        download_name = certificate.original_filename or f"certificate_{email}.{certificate.file_ext}"
+        
+        response = send_file(file_path, 
+                            as_attachment=True,
+                            download_name=download_name,
+                            conditional=True,
+                            etag=True,
+                            last_modified=certificate.upload_date)
         
-        return send_file(file_path, 
-                        as_attachment=True,
-                        download_name=download_name)
+        # Behind nginx, hand the transfer to an ``internal`` location instead of streaming it
+        accel_prefix = app.config.get('X_ACCEL_REDIRECT_PREFIX')
+        if accel_prefix and response.headers.pop('X-Sendfile', None):
+            response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{certificate.certificate_filename}"
+        
+        return response
     
     # Admin routes
     @app.route('/admin/login', methods=['GET', 'POST'])
@@ -163,9 +366,17 @@ def register_routes(app):
             password = request.form.get('password')
             
             # Check credentials against User table
-            user = User.query.filter_by(username=username).first()
+            user = db.session.execute(db.select(User).filter_by(username=username)).scalar()
+            
+            # Always verify a hash so unknown usernames can't be detected by timing
+            password_ok = check_password_hash(user.password_hash if user else _DUMMY_HASH, password or '')
             
-            if user and check_password_hash(user.password_hash, password):
+            if user and password_ok:
+                # Upgrade hashes created with an older method now that we know the password
+                if user.needs_rehash():
+                    user.password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+                    db.session.commit()
+                
                 session['admin_logged_in'] = True
                 session.permanent = True
                 flash('Login successful!', 'success')
@@ -182,28 +393,50 @@ def register_routes(app):
         flash('Logged out successfully', 'success')
         return redirect(url_for('admin_login'))
     
-    def admin_required(f):
-        """Decorator to require admin authentication"""
-        from functools import wraps
-        
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            if not session.get('admin_logged_in'):
-                flash('Please login to access admin panel', 'error')
-                return redirect(url_for('admin_login'))
-            return f(*args, **kwargs)
-        return decorated_function
-    
     @app.route('/admin/dashboard')
     @admin_required
     def admin_dashboard():
         """Admin dashboard"""
-        certificates = Certificate.query.order_by(Certificate.upload_date.desc()).all()
-        total_certificates = len(certificates)
+        q = request.args.get('q', '').strip()
+        per_page = app.config.get('DASHBOARD_PAGE_SIZE', 100)
+        
+        # Totals for the summary cards in a single aggregate query
+        total_certificates, last_upload = db.session.execute(
+            db.select(db.func.count(Certificate.id), db.func.max(Certificate.upload_date))
+        ).one()
+        
+        # Search runs in the database so it covers every page, not just the rendered one
+        matches = db.true()
+        matching = total_certificates
+        if q:
+            matches = db.or_(Certificate.email.icontains(q, autoescape=True),
+                             Certificate.certificate_filename.icontains(q, autoescape=True))
+            matching = db.session.execute(
+                db.select(db.func.count(Certificate.id)).where(matches)
+            ).scalar_one()
+        
+        pages = max((matching + per_page - 1) // per_page, 1)
+        page = min(max(request.args.get('page', 1, type=int), 1), pages)
+        
+        # Fetch only the columns the table renders, one page at a time
+        certificates = db.session.execute(
+            db.select(Certificate.id,
+                      Certificate.email,
+                      Certificate.certificate_filename,
+                      Certificate.upload_date)
+            .where(matches)
+            .order_by(Certificate.upload_date.desc())
+            .limit(per_page)
+            .offset((page - 1) * per_page)
+        ).all()
         
         return render_template('admin_dashboard.html', 
                              certificates=certificates,
-                             total=total_certificates)
+                             total=total_certificates,
+                             last_upload=last_upload,
+                             q=q,
+                             page=page,
+                             pages=pages)
     
     @app.route('/admin/upload', methods=['GET', 'POST'])
     @admin_required
@@ -218,102 +451,88 @@ def register_routes(app):
             files = request.files.getlist('certificates')
             successful_uploads = 0
             failed_uploads = []
+            rows = {}
+            upload_date = datetime.utcnow()
+            upload_dir = app.config['UPLOAD_FOLDER']  # created by Config.init_app
             
+            # Validate every file first; a later file for the same email replaces an earlier one
+            pending = {}
+            path_owners = {}  # file_path -> email, so no two pool threads write the same file
             for file in files:
                 if file and file.filename != '':
-                    if not allowed_file(file.filename):
-                        failed_uploads.append(f"{file.filename}: Invalid file type. Allowed: PDF, PNG, JPG, JPEG")
+                    # Get original filename
+                    original_filename = file.filename
+                    
+                    email, file_ext, error = classify_upload(original_filename)
+                    if error:
+                        failed_uploads.append(f"{original_filename}: {error}")
                         continue
                     
-                    try:
-                        # Get original filename
-                        original_filename = file.filename
-                        
-                        # Get file extension
-                        file_ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-                        
-                        # Extract email from filename
-                        # The filename should be in format: email.extension
-                        # For example: waqas@gmail.com.png
-                        if '.' in original_filename:
-                            # Remove extension to get email
-                            email_without_ext = original_filename.rsplit('.', 1)[0]
-                        else:
-                            # No extension found
-                            failed_uploads.append(f"{original_filename}: File must have an extension (e.g., .pdf, .png, .jpg)")
-                            continue
-                        
-                        email = email_without_ext.lower()
-                        
-                        print(f"DEBUG: Processing {original_filename}")
-                        print(f"DEBUG: Email extracted: {email}")
-                        print(f"DEBUG: File extension: {file_ext}")
-                        
-                        # Validate email format
-                        if not validate_email(email):
-                            failed_uploads.append(f"{original_filename}: Invalid Gmail address. Must be like 'example@gmail.com'")
-                            continue
-                        
-                        # Validate file extension
-                        if file_ext not in app.config['ALLOWED_EXTENSIONS']:
-                            failed_uploads.append(f"{original_filename}: Invalid file extension. Allowed: {', '.join(app.config['ALLOWED_EXTENSIONS'])}")
-                            continue
-                        
-                        # Secure filename (preserve original name)
-                        secure_name = secure_filename(original_filename)
-                        
-                        # Check if certificate already exists for this email
-                        existing = Certificate.query.filter_by(email=email).first()
-                        if existing:
-                            print(f"DEBUG: Updating existing certificate for {email}")
-                            # Update existing certificate
-                            existing.certificate_filename = secure_name
-                            existing.original_filename = original_filename
-                            existing.upload_date = datetime.utcnow()
-                        else:
-                            print(f"DEBUG: Creating new certificate for {email}")
-                            # Create new certificate record
-                            certificate = Certificate(
-                                email=email,
-                                certificate_filename=secure_name,
-                                original_filename=original_filename
-                            )
-                            db.session.add(certificate)
-                        
-                        # Ensure upload directory exists
-                        upload_dir = app.config['UPLOAD_FOLDER']
-                        os.makedirs(upload_dir, exist_ok=True)
-                        
-                        # Save file
-                        file_path = os.path.join(upload_dir, secure_name)
-                        print(f"DEBUG: Saving to: {file_path}")
-                        file.save(file_path)
-                        
-                        # Verify file was saved
-                        if os.path.exists(file_path):
-                            file_size = os.path.getsize(file_path)
-                            print(f"DEBUG: File saved successfully. Size: {file_size} bytes")
-                            successful_uploads += 1
-                        else:
-                            error_msg = f"{original_filename}: Failed to save file"
-                            print(f"DEBUG: {error_msg}")
-                            failed_uploads.append(error_msg)
+                    logger.debug("Processing %s (email: %s, extension: %s)", original_filename, email, file_ext)
+                    
+                    # Validate file contents
+                    if not is_certificate_file(file.stream, file_ext):
+                        failed_uploads.append(f"{original_filename}: File content is not a valid {file_ext.upper()} file")
+                        continue
+                    
+                    # Secure filename (preserve original name)
+                    secure_name = secure_filename(original_filename)
+                    file_path = os.path.join(upload_dir, secure_name)
+                    owner = path_owners.get(file_path)
+                    if owner is not None and owner != email:
+                        failed_uploads.append(f"{original_filename}: Filename collides with {pending[owner][2]}")
+                        continue
+                    if email in pending:
+                        _, superseded_path, superseded, _ = pending[email]
+                        del path_owners[superseded_path]
+                        failed_uploads.append(f"{superseded}: Superseded by {original_filename}")
+                    pending[email] = (file, file_path, original_filename, secure_name)
+                    path_owners[file_path] = email
+            
+            # Disk writes release the GIL, so save the files concurrently
+            with ThreadPoolExecutor(max_workers=_UPLOAD_WORKERS) as executor:
+                saves = {email: executor.submit(save_upload, file, file_path)
+                         for email, (file, file_path, _, _) in pending.items()}
+            
+            for email, (file, file_path, original_filename, secure_name) in pending.items():
+                try:
+                    saves[email].result()
+                    
+                    # Verify file was saved
+                    if os.path.exists(file_path):
+                        file_size = os.path.getsize(file_path)
+                        logger.debug("Saved %s (%d bytes)", file_path, file_size)
+                        successful_uploads += 1
                         
-                    except Exception as e:
-                        error_msg = f"{original_filename}: {str(e)}"
-                        print(f"ERROR: {error_msg}")
-                        import traceback
-                        traceback.print_exc()
+                        # Queue the record for the batched upsert
+                        rows[email] = {
+                            'email': email,
+                            'certificate_filename': secure_name,
+                            'original_filename': original_filename,
+                            'upload_date': upload_date,
+                        }
+                    else:
+                        error_msg = f"{original_filename}: Failed to save file"
+                        logger.warning("File missing after save: %s", file_path)
                         failed_uploads.append(error_msg)
+                    
+                except Exception as e:
+                    error_msg = f"{original_filename}: {str(e)}"
+                    logger.exception("Upload failed for %s", original_filename)
+                    failed_uploads.append(error_msg)
             
-            # Commit all changes
+            # Insert or update all certificates in a single statement
             try:
+                if rows:
+                    upsert_certificates(list(rows.values()))
                 db.session.commit()
-                print(f"DEBUG: Database commit successful")
+                for email in rows:
+                    forget_certificate(email)
+                logger.debug("Database commit successful")
             except Exception as e:
                 db.session.rollback()
                 error_msg = f"Database error: {str(e)}"
-                print(f"ERROR: {error_msg}")
+                logger.exception("Database commit failed")
                 failed_uploads.append(error_msg)
             
             # Show results
@@ -333,24 +552,25 @@ def register_routes(app):
     @admin_required
     def admin_delete(certificate_id):
         """Delete a certificate"""
-        certificate = Certificate.query.get_or_404(certificate_id)
+        certificate = db.session.get(Certificate, certificate_id) or abort(404)
         
         try:
             # Delete file
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], certificate.certificate_filename)
             if os.path.exists(file_path):
                 os.remove(file_path)
-                print(f"Deleted file: {file_path}")
+                logger.info("Deleted file: %s", file_path)
             
             # Delete database record
             db.session.delete(certificate)
             db.session.commit()
+            forget_certificate(certificate.email)
             
             flash('Certificate deleted successfully', 'success')
         except Exception as e:
             db.session.rollback()
             flash(f'Error deleting certificate: {str(e)}', 'error')
-            print(f"Delete error: {e}")
+            logger.exception("Delete error")
         
         return redirect(url_for('admin_dashboard'))
 
@@ -358,7 +578,7 @@ def register_routes(app):
     @admin_required
     def admin_replace(certificate_id):
         """Replace a certificate file"""
-        certificate = Certificate.query.get_or_404(certificate_id)
+        certificate = db.session.get(Certificate, certificate_id) or abort(404)
         
         if 'certificate_file' not in request.files:
             flash('No file selected', 'error')
@@ -367,16 +587,22 @@ def register_routes(app):
         file = request.files['certificate_file']
         
         if file and file.filename != '':
-            if not allowed_file(file.filename):
+            _, dot, ext = file.filename.rpartition('.')
+            ext = ext.lower()
+            if not dot or not allowed_extension(ext):
                 flash('Invalid file type. Allowed: PDF, PNG, JPG, JPEG', 'error')
                 return redirect(url_for('admin_dashboard'))
             
+            if not is_certificate_file(file.stream, ext):
+                flash(f'File content is not a valid {ext.upper()} file', 'error')
+                return redirect(url_for('admin_dashboard'))
+            
             try:
                 # Delete old file
                 old_file_path = os.path.join(app.config['UPLOAD_FOLDER'], certificate.certificate_filename)
                 if os.path.exists(old_file_path):
                     os.remove(old_file_path)
-                    print(f"Deleted old file: {old_file_path}")
+                    logger.info("Deleted old file: %s", old_file_path)
                 
                 # Save new file with secure filename
                 filename = secure_filename(file.filename)
@@ -388,20 +614,21 @@ def register_routes(app):
                     filename = f"{certificate.email}{ext}"
                 
                 file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                print(f"Saved new file: {file_path}")
+                save_upload(file, file_path)
+                logger.info("Saved new file: %s", file_path)
                 
                 # Update database
                 certificate.certificate_filename = filename
                 certificate.original_filename = file.filename
                 certificate.upload_date = datetime.utcnow()
                 db.session.commit()
+                forget_certificate(certificate.email)
                 
                 flash('Certificate replaced successfully', 'success')
             except Exception as e:
                 db.session.rollback()
                 flash(f'Error replacing certificate: {str(e)}', 'error')
-                print(f"Replace error: {e}")
+                logger.exception("Replace error")
         
         return redirect(url_for('admin_dashboard'))
     # Error handlers
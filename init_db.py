@@ -1,5 +1,5 @@
 # init_db.py
-from app import create_app, db
+from app import create_app, db, PASSWORD_HASH_METHOD
 from datetime import datetime
 
 app = create_app()
@@ -27,7 +27,7 @@ with app.app_context():
         # Create admin user
         admin_user = User(
             username='admin',
-            password_hash=generate_password_hash('admin123')
+            password_hash=generate_password_hash('admin123', method=PASSWORD_HASH_METHOD)
         )
         db.session.add(admin_user)
         db.session.commit()
@@ -1,100 +1,50 @@
 # setup_render.py
+import hashlib
+import importlib.util
+import json
 import os
+import py_compile
+import re
 import secrets
-
-print("=" * 60)
-print("🚀 RENDER.COM DEPLOYMENT SETUP")
-print("=" * 60)
-
-# Generate secure credentials
-secret_key = secrets.token_hex(32)
-admin_password = secrets.token_hex(16)
-
-print("\n📁 Creating deployment files...")
-
-# 1. Create render.yaml
-render_config = '''services:
-  - type: web
-    name: certificate-system
-    runtime: python
-    region: oregon  # Options: oregon, frankfurt, singapore
-    plan: free
-    buildCommand: "pip install -r requirements.txt"
-    startCommand: "gunicorn app:app"
-    envVars:
-      - key: FLASK_ENV
-        value: production
-      - key: PYTHON_VERSION
-        value: 3.11.0
-    disk:
-      name: uploads
-      mountPath: /opt/render/project/src/uploads
-      sizeGB: 1
-'''
-
-with open('render.yaml', 'w') as f:
-    f.write(render_config)
-print("✅ Created render.yaml")
-
-# 2. Create requirements.txt
-requirements = '''Flask==2.3.3
-Flask-SQLAlchemy==3.0.5
-gunicorn==21.2.0
-Werkzeug==3.0.1
-Pillow==10.1.0
-python-dotenv==1.0.0
-psycopg2-binary==2.9.9
-email-validator==2.0.0
-'''
-
-with open('requirements.txt', 'w') as f:
-    f.write(requirements)
-print("✅ Created requirements.txt")
-
-# 3. Create Procfile
-with open('Procfile', 'w') as f:
-    f.write('web: gunicorn app:app --bind 0.0.0.0:$PORT --workers 2 --threads 4')
-print("✅ Created Procfile")
-
-# 4. Create runtime.txt
-with open('runtime.txt', 'w') as f:
-    f.write('python-3.11.0')
-print("✅ Created runtime.txt")
-
-# 5. Create .env.example with your generated credentials
-env_content = f'''# Render Deployment Configuration
-# COPY THIS TO .env FILE AND UPDATE VALUES
-
-# Flask Configuration
-FLASK_ENV=production
-SECRET_KEY={secret_key}
-
-# Admin Credentials (CHANGE THESE!)
-ADMIN_USERNAME=admin
-ADMIN_PASSWORD={admin_password}
-
-# Database (Render will provide DATABASE_URL automatically)
-# DATABASE_URL will be auto-set by Render PostgreSQL
-
-# File Upload Settings
-MAX_CONTENT_LENGTH=16777216  # 16MB
-ALLOWED_EXTENSIONS=pdf,png,jpg,jpeg
-
-# Server Settings
-PORT=10000
-HOST=0.0.0.0
-
-# Application Settings
-UPLOAD_FOLDER=uploads/certificates
-'''
-
-with open('.env.example', 'w') as f:
-    f.write(env_content)
-print("✅ Created .env.example")
-
-# 6. Create .gitignore if not exists
-if not os.path.exists('.gitignore'):
-    gitignore = '''# Python
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Final
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+# Values for the Jinja templates in deploy_templates/ (render.yaml, Procfile, runtime.txt, .env.example)
+DEPLOY_CONTEXT: Final = {
+    'service_name': 'certificate-system',
+    'region': 'oregon',
+    'plan': 'free',
+    'python_version': '3.11.0',
+    'workers': 2,
+    'threads': 4,
+}
+TEMPLATE_DIR: Final = Path(__file__).resolve().parent / 'deploy_templates'
+TEMPLATE_CACHE_DIR: Final = '.jinja_cache'
+SETUP_CACHE_DIR: Final = '.setup_cache'
+PIP_COMPILE_TIMEOUT: Final = 300  # seconds; falls back to the plain pins when exceeded
+SETUP_REPORT: Final = '.last_setup_report.txt'  # credentials and next steps from the last run
+
+# Static file contents, built once at import
+REQUIREMENT_PINS: Final = (
+    'Flask==2.3.3',
+    'Flask-SQLAlchemy==3.0.5',
+    'cachetools==5.3.2',
+    'gunicorn==21.2.0',
+    'Werkzeug==3.0.1',
+    'Pillow==10.1.0',
+    'python-dotenv==1.0.0',
+    'psycopg2-binary==2.9.9',
+    'email-validator==2.0.0',
+)
+# Sorted so the same pins always produce the same file (and content hash)
+REQUIREMENTS: Final[str] = ''.join(f'{pin}\n' for pin in sorted(REQUIREMENT_PINS, key=str.lower))
+
+GITIGNORE: Final[str] = '''# Python
 __pycache__/
 *.py[cod]
 *$py.class
@@ -140,13 +90,15 @@ Thumbs.db
 # Coverage
 .coverage
 htmlcov/
+
+# Setup caches
+.jinja_cache/
+.setup_cache/
+.last_setup_report.txt
 '''
-    with open('.gitignore', 'w') as f:
-        f.write(gitignore)
-    print("✅ Created .gitignore")
 
-# 7. Update config.py for Render
-config_content = '''import os
+CONFIG_CONTENT: Final[str] = '''import logging
+import os
 from datetime import timedelta
 from urllib.parse import urlparse
 
@@ -166,13 +118,33 @@ class Config:
         SQLALCHEMY_DATABASE_URI = 'sqlite:///certificates.db'
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {'pool_recycle': 300}
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        # Allow gunicorn's worker threads to reuse pooled SQLite connections
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'check_same_thread': False}}
+    else:
+        # Enough connections for every gunicorn thread, with room for bursts
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_pre_ping': True,
+            'pool_recycle': 300,
+            'connect_args': {'application_name': 'certsys'},
+            # Send executemany() calls (e.g. the bulk-upload upsert) as pages, not row by row
+            'executemany_mode': 'values_plus_batch',
+        }
     
     # File upload configuration
     UPLOAD_FOLDER = os.path.join('uploads', 'certificates')
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
     
+    # Let the front-end server send certificate files (X-Sendfile, or nginx X-Accel-Redirect)
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+    X_ACCEL_REDIRECT_PREFIX = os.environ.get('X_ACCEL_REDIRECT_PREFIX')  # e.g. /protected
+    
+    # Admin dashboard
+    DASHBOARD_PAGE_SIZE = 100
+    
     # Admin credentials
     ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
     ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
@@ -182,16 +154,19 @@ class Config:
     SESSION_COOKIE_SECURE = True  # Use secure cookies in production
     SESSION_COOKIE_HTTPONLY = True
     
+    # Logging
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    
     @staticmethod
     def init_app(app):
         """Initialize app with configuration"""
+        logging.basicConfig(level=app.config['LOG_LEVEL'],
+                            format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+        
         # Ensure upload directory exists
         upload_path = app.config['UPLOAD_FOLDER']
         os.makedirs(upload_path, exist_ok=True)
         
-        # Create uploads directory structure
-        os.makedirs('uploads/certificates', exist_ok=True)
-        
         print(f"✅ Upload folder configured at: {upload_path}")
         print(f"✅ Database URI: {app.config['SQLALCHEMY_DATABASE_URI'][:50]}...")
 
@@ -200,6 +175,7 @@ class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     SESSION_COOKIE_SECURE = False  # Allow HTTP in development
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG')
 
 
 class ProductionConfig(Config):
@@ -208,6 +184,7 @@ class ProductionConfig(Config):
     
     # Production-specific settings
     PREFERRED_URL_SCHEME = 'https'
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     
     @property
     def SQLALCHEMY_DATABASE_URI(self):
@@ -228,93 +205,296 @@ config = {
 }
 '''
 
-with open('config.py', 'w') as f:
-    f.write(config_content)
-print("✅ Updated config.py for Render")
+# app.py patching: the production app factory is spliced in with one regex pass
+PRODUCTION_APP_MARKER: Final[str] = '# Use production config on Render'
+RENDER_APP_FACTORY: Final[str] = (PRODUCTION_APP_MARKER + '\n'
+                                  'if os.environ.get("RENDER"):\n'
+                                  '    app = create_app("production")\n'
+                                  'else:\n'
+                                  '    app = create_app()')
+MAIN_APP_FACTORY: Final[str] = (PRODUCTION_APP_MARKER + '\n'
+                                'if os.environ.get("RENDER") or os.environ.get("FLASK_ENV") == "production":\n'
+                                '    app = create_app("production")\n'
+                                'else:\n'
+                                '    app = create_app()\n'
+                                '\n')
+_CREATE_APP_RE = re.compile(r'^app = create_app\(\)$', re.M)
+_MAIN_GUARD_RE = re.compile(r'''^if __name__ == ['"]__main__['"]:''', re.M)
+
+REQUIRED_DIRS = {'uploads/certificates', 'static/css', 'static/js', 'static/images'}
+
+
+# Status lines are buffered and written once per phase instead of print() per line
+LOG = []
+
+
+def flush_log():
+    if LOG:
+        sys.stdout.write('\n'.join(LOG) + '\n')
+        sys.stdout.flush()
+        LOG.clear()
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def maybe_write(path, content, exists=True):
+    """Write content to path unless the file already holds exactly that content.
+
+    Skipping identical rewrites keeps mtimes stable, so pip and Docker build caches survive re-runs.
+    Pass exists=False when the file is known to be missing to skip the comparison.
+    Returns True when the file was written.
+    """
+    data = content.encode()
+    try:
+        if exists and _digest(Path(path).read_bytes()) == _digest(data):
+            return False
+    except FileNotFoundError:
+        pass
+    Path(path).write_bytes(data)
+    return True
+
+
+def locked_requirements():
+    """Return requirements.txt content, pinned with hashes when pip-tools is installed.
+
+    pip-compile output is cached in SETUP_CACHE_DIR under the digest of its input.
+    """
+    if importlib.util.find_spec('piptools') is None:
+        return REQUIREMENTS
+    cache_file = Path(SETUP_CACHE_DIR) / f"requirements-{_digest(REQUIREMENTS.encode()).hex()}.txt"
+    if cache_file.exists():
+        return cache_file.read_text()
+    try:
+        result = subprocess.run(
+            [sys.executable, '-m', 'piptools', 'compile', '--generate-hashes', '--quiet',
+             '--no-header', '--strip-extras', '--output-file', '-', '-'],
+            input=REQUIREMENTS, capture_output=True, text=True, timeout=PIP_COMPILE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return REQUIREMENTS
+    if result.returncode != 0:
+        # e.g. offline: fall back to the plain sorted pins
+        return REQUIREMENTS
+    os.makedirs(SETUP_CACHE_DIR, exist_ok=True)
+    cache_file.write_text(result.stdout)
+    return result.stdout
+
+
+def write_cached(path, key_source, produce):
+    """Write path from the content-addressed artifact cache in SETUP_CACHE_DIR.
+
+    key_source must cover everything the output depends on. On a cache miss produce() is
+    called once and its result stored under .setup_cache/<key>/; the entry is then copied
+    into place with maybe_write, so edits to path never leak back into the cache.
+    Returns True when path was written.
+    """
+    target = Path(path)
+    cached = Path(SETUP_CACHE_DIR, _digest(key_source.encode()).hex(), target.name)
+    try:
+        if os.path.samefile(target, cached):
+            # Hard-linked by an earlier version of this script, so in-place edits of path
+            # may have reached the entry: drop both and produce the file again
+            target.unlink()
+            cached.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        content = cached.read_text()
+    except FileNotFoundError:
+        content = produce()
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        # Stored via rename, so an interrupted run never leaves a partial entry behind
+        tmp = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+        tmp.write_text(content)
+        os.replace(tmp, cached)
+    return maybe_write(path, content)
+
+
+def write_secret_file(path, content):
+    """Create path readable by the owner only (0600), never replacing an existing file.
+
+    Returns False when the file already exists.
+    """
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    return True
+
+
+LOG.append("=" * 60)
+LOG.append("🚀 RENDER.COM DEPLOYMENT SETUP")
+LOG.append("=" * 60)
+
+LOG.append("\n📁 Creating deployment files...")
+
+# One directory read answers every "does this file exist?" question below
+existing = {entry.name for entry in os.scandir('.')}
+
+# Compiled templates are cached on disk, so re-runs skip parsing them
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+templates = Environment(loader=FileSystemLoader(TEMPLATE_DIR),
+                        auto_reload=False,
+                        keep_trailing_newline=True,
+                        bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR))
+
+
+def render(name, **extra):
+    return templates.get_template(name).render(DEPLOY_CONTEXT, **extra)
+
+
+def write_template(path, name):
+    """Write path from the cache, keyed on the template source and DEPLOY_CONTEXT."""
+    source, _, _ = templates.loader.get_source(templates, name)
+    return write_cached(path, source + json.dumps(DEPLOY_CONTEXT, sort_keys=True),
+                       lambda: render(name))
+
+
+# (path, writer, status message) for every generated file, written in one pass below;
+# each writer returns True when the file changed
+generated_files = []
+
+# 1. Create render.yaml
+generated_files.append(('render.yaml', lambda: write_template('render.yaml', 'render.yaml.j2'),
+                        "✅ Created render.yaml"))
+
+# 2. Create requirements.txt
+generated_files.append(('requirements.txt',
+                        lambda: maybe_write('requirements.txt', locked_requirements(),
+                                            'requirements.txt' in existing),
+                        "✅ Created requirements.txt"))
+
+# 3. Create Procfile
+generated_files.append(('Procfile', lambda: write_template('Procfile', 'Procfile.j2'),
+                        "✅ Created Procfile"))
+
+# 4. Create runtime.txt
+generated_files.append(('runtime.txt', lambda: write_template('runtime.txt', 'runtime.txt.j2'),
+                        "✅ Created runtime.txt"))
+
+# 5. Create .env.example with freshly generated credentials
+# Created owner-only and never overwritten; an existing file keeps its credentials
+secret_key = admin_password = None
+if '.env.example' not in existing:
+    # URL-safe base64 uses only [A-Za-z0-9_-], so the values need no quoting in .env files
+    secret_key = secrets.token_urlsafe(48)
+    admin_password = secrets.token_urlsafe(16)
+    env_content = render('env.example.j2', secret_key=secret_key, admin_password=admin_password)
+    if not write_secret_file('.env.example', env_content):
+        secret_key = admin_password = None
+if secret_key:
+    LOG.append("✅ Created .env.example")
+else:
+    LOG.append("⏭️  .env.example already exists; keeping its credentials")
+
+# 6. Create .gitignore if not exists
+if '.gitignore' not in existing:
+    generated_files.append(('.gitignore', lambda: maybe_write('.gitignore', GITIGNORE, False),
+                            "✅ Created .gitignore"))
+
+# 7. Update config.py for Render
+generated_files.append(('config.py',
+                        lambda: maybe_write('config.py', CONFIG_CONTENT, 'config.py' in existing),
+                        "✅ Updated config.py for Render"))
+
+# The files are independent, so write them concurrently
+with ThreadPoolExecutor(max_workers=8) as executor:
+    written = list(executor.map(lambda item: item[1](), generated_files))
+for (path, writer, message), changed in zip(generated_files, written):
+    LOG.append(message if changed else f"⏭️  {path} unchanged")
+flush_log()
 
 # 8. Update app.py for production
-print("\n📝 Checking app.py for production readiness...")
+LOG.append("\n📝 Checking app.py for production readiness...")
 
 # Read current app.py
-with open('app.py', 'r') as f:
-    app_content = f.read()
-
-# Ensure production config is used
-if 'create_app(config_name=\'production\')' not in app_content:
-    # Find the app creation line
-    if 'app = create_app()' in app_content:
-        app_content = app_content.replace(
-            'app = create_app()',
-            '# Use production config on Render\nif os.environ.get("RENDER"):\n    app = create_app("production")\nelse:\n    app = create_app()'
-        )
-    elif 'app = create_app(config_name=' not in app_content:
+app_path = Path('app.py')
+app_content = app_path.read_text()
+
+# Ensure production config is used (skipped once app.py has been patched)
+if ('create_app(config_name=\'production\')' not in app_content
+        and PRODUCTION_APP_MARKER not in app_content):
+    # Replace the module-level app creation line
+    app_content, patched = _CREATE_APP_RE.subn(lambda m: RENDER_APP_FACTORY, app_content, count=1)
+    if not patched and 'app = create_app(config_name=' not in app_content:
         # Add at the end before if __name__ block
-        lines = app_content.split('\n')
-        new_lines = []
-        for line in lines:
-            if line.strip() == 'if __name__ == \'__main__\':':
-                new_lines.append('# Use production config on Render')
-                new_lines.append('if os.environ.get("RENDER") or os.environ.get("FLASK_ENV") == "production":')
-                new_lines.append('    app = create_app("production")')
-                new_lines.append('else:')
-                new_lines.append('    app = create_app()')
-                new_lines.append('')
-            new_lines.append(line)
-        app_content = '\n'.join(new_lines)
+        app_content, patched = _MAIN_GUARD_RE.subn(lambda m: MAIN_APP_FACTORY + m.group(0),
+                                                   app_content, count=1)
     
-    with open('app.py', 'w') as f:
-        f.write(app_content)
-    print("✅ Updated app.py for production")
-
-# 9. Create directories
-os.makedirs('uploads/certificates', exist_ok=True)
-os.makedirs('static/css', exist_ok=True)
-os.makedirs('static/js', exist_ok=True)
-os.makedirs('static/images', exist_ok=True)
-print("✅ Created required directories")
-
-print("\n" + "=" * 60)
-print("✅ SETUP COMPLETE!")
-print("=" * 60)
-
-print("\n📋 YOUR DEPLOYMENT CREDENTIALS:")
-print("-" * 40)
-print(f"🔐 Secret Key: {secret_key}")
-print(f"👤 Admin Username: admin")
-print(f"🔑 Admin Password: {admin_password}")
-print("-" * 40)
-print("⚠️  IMPORTANT: Change admin password after deployment!")
-
-print("\n🚀 NEXT STEPS:")
-print("=" * 60)
-print("1. Review the created files")
-print("2. Rename '.env.example' to '.env'")
-print("3. Update .env with your actual values")
-print("4. Push to GitHub:")
-print("   git add .")
-print("   git commit -m 'Ready for Render deployment'")
-print("   git push origin main")
-print("")
-print("5. DEPLOY ON RENDER:")
-print("   a. Go to: https://render.com")
-print("   b. Sign up with GitHub")
-print("   c. Click 'New +' → 'Web Service'")
-print("   d. Connect your GitHub repository")
-print("   e. Fill in the deployment form")
-print("   f. Add PostgreSQL database")
-print("   g. Add environment variables")
-print("   h. Deploy!")
-print("")
-print("🌐 Your app will be live at:")
-print("   https://certificate-system.onrender.com")
-print("=" * 60)
-
-print("\n⚙️  RENDER DEPLOYMENT FORM SETTINGS:")
-print("-" * 40)
-print("Name: certificate-system")
-print("Environment: Python 3")
-print("Build Command: pip install -r requirements.txt")
-print("Start Command: gunicorn app:app")
-print("Plan: Free")
-print("Region: Oregon (or choose closest to you)")
-print("-" * 40)
\ No newline at end of file
+    if patched and maybe_write(app_path, app_content):
+        LOG.append("✅ Updated app.py for production")
+
+# Byte-compile the generated modules now so gunicorn workers don't on first import
+for module in ('config.py', app_path):
+    py_compile.compile(module, doraise=True)
+LOG.append("✅ Compiled config.py and app.py")
+
+# 9. Create directories (leaf paths only; makedirs creates the parents)
+for directory in sorted(REQUIRED_DIRS):
+    os.makedirs(directory, exist_ok=True)
+LOG.append("✅ Created required directories")
+
+LOG.append("\n" + "=" * 60)
+LOG.append("✅ SETUP COMPLETE!")
+LOG.append("=" * 60)
+flush_log()
+
+# Credentials and instructions go out in one write, and are kept owner-only in
+# SETUP_REPORT so they can be shown again without re-running this script.
+# Only credentials this run actually saved are reported.
+if secret_key:
+    CREDENTIALS = f"""
+🔐 Secret Key: {secret_key}
+👤 Admin Username: admin
+🔑 Admin Password: {admin_password}"""
+else:
+    CREDENTIALS = """
+🔐 Use the SECRET_KEY, ADMIN_USERNAME and ADMIN_PASSWORD
+   already in your existing .env.example"""
+
+NEXT_STEPS = f"""
+📋 YOUR DEPLOYMENT CREDENTIALS:
+{'-' * 40}{CREDENTIALS}
+{'-' * 40}
+⚠️  IMPORTANT: Change admin password after deployment!
+
+🚀 NEXT STEPS:
+{'=' * 60}
+1. Review the created files
+2. Rename '.env.example' to '.env'
+3. Update .env with your actual values
+4. Push to GitHub:
+   git add .
+   git commit -m 'Ready for Render deployment'
+   git push origin main
+
+5. DEPLOY ON RENDER:
+   a. Go to: https://render.com
+   b. Sign up with GitHub
+   c. Click 'New +' → 'Web Service'
+   d. Connect your GitHub repository
+   e. Fill in the deployment form
+   f. Add PostgreSQL database
+   g. Add environment variables
+   h. Deploy!
+
+🌐 Your app will be live at:
+   https://certificate-system.onrender.com
+{'=' * 60}
+
+⚙️  RENDER DEPLOYMENT FORM SETTINGS:
+{'-' * 40}
+Name: certificate-system
+Environment: Python 3
+Build Command: pip install -r requirements.txt
+Start Command: gunicorn app:app
+Plan: Free
+Region: Oregon (or choose closest to you)
+{'-' * 40}
+"""
+Path(SETUP_REPORT).unlink(missing_ok=True)
+write_secret_file(SETUP_REPORT, NEXT_STEPS)
+sys.stdout.write(NEXT_STEPS)